@@ -1,25 +1,35 @@
 # Expose the Connection components
-from .connection import init_driver, close_driver, get_driver, query
+from .connection import init_driver, close_driver, get_driver, get_session, query, execute_write, has_apoc
 
 # Expose the Repository components (The "Memory")
 from .repository import save_chat_history
 
 # Expose the Queries (Optional, but good for debugging)
-from .queries import MERGE_CONVERSATION_TURN, FETCH_UNEMBEDDED_MESSAGES, FETCH_UNPROCESSED_SOURCES, WRITE_VECTOR_BATCH, VECTOR_LOOKUP, WRITE_CHUNKS, LINK_SOURCES_FROM_VECTOR_LOOKUP
+from .queries import MERGE_CONVERSATION_TURN, FETCH_UNEMBEDDED_MESSAGES, FETCH_UNPROCESSED_SOURCES, FETCH_UNEMBEDDED_MESSAGES_BY_ID, FETCH_UNPROCESSED_SOURCES_BY_URL, WRITE_VECTOR_BATCH, WRITE_VECTOR_BATCH_APOC, VECTOR_LOOKUP_MSG, VECTOR_LOOKUP_CHUNK, VECTOR_TOP_K, VECTOR_MIN_SCORE, WRITE_CHUNKS, LINK_DUPLICATE_SOURCES, LINK_SOURCES_FROM_VECTOR_LOOKUP
 from .schema import VECTOR_DIM
 
 __all__ = [
     "init_driver",
     "close_driver",
     "get_driver",
+    "get_session",
     "query",
+    "execute_write",
+    "has_apoc",
     "save_chat_history",
     "MERGE_CONVERSATION_TURN",
     "FETCH_UNEMBEDDED_MESSAGES",
     "FETCH_UNPROCESSED_SOURCES",
+    "FETCH_UNEMBEDDED_MESSAGES_BY_ID",
+    "FETCH_UNPROCESSED_SOURCES_BY_URL",
     "WRITE_VECTOR_BATCH",
+    "WRITE_VECTOR_BATCH_APOC",
     "WRITE_CHUNKS",
-    "VECTOR_LOOKUP",
+    "LINK_DUPLICATE_SOURCES",
+    "VECTOR_LOOKUP_MSG",
+    "VECTOR_LOOKUP_CHUNK",
+    "VECTOR_TOP_K",
+    "VECTOR_MIN_SCORE",
     "LINK_SOURCES_FROM_VECTOR_LOOKUP",
     "VECTOR_DIM"
 ]
\ No newline at end of file
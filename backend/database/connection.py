@@ -1,25 +1,39 @@
 import os
+import time
+import asyncio
 import logging
-from neo4j import AsyncGraphDatabase
+from contextlib import asynccontextmanager
+from neo4j import AsyncGraphDatabase, RoutingControl
 
-from .schema import NEO4J_SCHEMA
+from .schema import NEO4J_SCHEMA_STATEMENTS, VECTOR_INDEXES, VECTOR_DIM
+from .queries import WARMUP_VECTOR_INDEX, CHECK_APOC_ITERATE
 
-# Set up logging
-logging.basicConfig(level=logging.WARNING)
+# Logging is configured by the entrypoint (main.py)
 logger = logging.getLogger(__name__)
 
 # Global variable to hold the driver
 driver = None
 NEO4J_DB = "neo4j" # Default database name
+APOC_AVAILABLE = False # Detected at startup (see has_apoc)
+
+# Connection pool settings (bounded so bursts queue instead of opening new sockets)
+# Overridable via NEO4J_POOL / NEO4J_ACQ_TIMEOUT / NEO4J_TX_RETRY_TIME.
+# Keep the pool at >= 2x EMBED_CONCURRENCY so maintenance can't starve chat requests.
+MAX_POOL_SIZE = 64
+ACQUISITION_TIMEOUT = 10  # seconds
+MAX_TX_RETRY_TIME = 15  # seconds
 
 async def init_driver():
     """Initializes the Neo4j driver using env vars."""
-    global driver, NEO4J_DB
+    global driver, NEO4J_DB, APOC_AVAILABLE, MAX_POOL_SIZE, ACQUISITION_TIMEOUT, MAX_TX_RETRY_TIME
 
     uri = os.getenv("NEO4J_URI")
     user = os.getenv("NEO4J_USERNAME")
     password = os.getenv("NEO4J_PASSWORD")
     NEO4J_DB = os.getenv("NEO4J_DB", "neo4j")
+    MAX_POOL_SIZE = int(os.getenv("NEO4J_POOL", MAX_POOL_SIZE))
+    ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_ACQ_TIMEOUT", ACQUISITION_TIMEOUT))
+    MAX_TX_RETRY_TIME = float(os.getenv("NEO4J_TX_RETRY_TIME", MAX_TX_RETRY_TIME))
 
     if not all([uri, user, password]):
         msg = "Missing Neo4j environment variables (NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD)"
@@ -27,7 +41,18 @@ async def init_driver():
         raise ValueError(msg)
 
     try:
-        driver = AsyncGraphDatabase.driver(uri, auth=(user, password))
+        driver = AsyncGraphDatabase.driver(
+            uri,
+            auth=(user, password),
+            max_connection_pool_size=MAX_POOL_SIZE,
+            connection_acquisition_timeout=ACQUISITION_TIMEOUT,
+            max_transaction_retry_time=MAX_TX_RETRY_TIME,
+            keep_alive=True
+        )
+        logger.info(
+            f"🏊 Pool: max {MAX_POOL_SIZE} connections, "
+            f"{ACQUISITION_TIMEOUT}s acquisition timeout, {MAX_TX_RETRY_TIME}s tx retry"
+        )
         
         # Verify Connectivity (includes DB check via Eager API)
         # We run a simple query to ensure the DB exists and we have access.
@@ -41,31 +66,62 @@ async def init_driver():
         # --- ROBUST SCHEMA APPLICATION ---
         logger.info("⚙️  Applying schema...")
         
-        # Split the raw string by semicolon
-        # We filter out empty lines to avoid syntax errors
-        statements = [
-            stmt.strip() for stmt in NEO4J_SCHEMA.split(";") 
-            if stmt.strip()
-        ]
-
-        # Run each statement individually
-        # We use a managed session so we get retries for free
-        async with driver.session(database=NEO4J_DB) as session:
-            for statement in statements:
-                try:
-                    await session.run(statement)
-                except Exception as e:
-                    # Log but don't crash the entire app if one index fails (e.g. already exists)
-                    logger.warning(f"   ⚠️ Schema warning: {e}")
+        # The statements are pre-split in schema.py and are all independent
+        # (CREATE ... IF NOT EXISTS), so we send them concurrently.
+        # execute_query gives each its own session (and retries) from the pool.
+        results = await asyncio.gather(
+            *(driver.execute_query(statement, database_=NEO4J_DB) for statement in NEO4J_SCHEMA_STATEMENTS),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                # Log but don't crash the entire app if one index fails (e.g. already exists)
+                logger.warning(f"   ⚠️ Schema warning: {result}")
         
         logger.info(f"✅ Schema applied to database: {NEO4J_DB}")
 
+        # --- WARMUP ---
+        await _warm_up()
+
+        # --- FEATURE DETECTION ---
+        try:
+            result = await driver.execute_query(CHECK_APOC_ITERATE, database_=NEO4J_DB, routing_=RoutingControl.READ)
+            APOC_AVAILABLE = result.records[0]["available"]
+        except Exception as e:
+            logger.warning(f"   ⚠️ Could not check for APOC: {e}")
+        logger.info(f"🧩 APOC periodic.iterate available: {APOC_AVAILABLE}")
+
     except Exception as e:
         logger.error(f"❌ Failed to connect to Neo4j: {e}")
         if driver:
             await driver.close()
         raise e
 
+async def _warm_up():
+    """
+    Probes each vector index once so the first real user query
+    doesn't pay the cold page-cache / HNSW load penalty.
+    Failures (e.g. an index still populating) are logged, never raised.
+    """
+    start = time.perf_counter()
+    # Any non-zero vector works (cosine rejects the zero vector)
+    probe = [1.0] + [0.0] * (VECTOR_DIM - 1)
+
+    results = await asyncio.gather(
+        *(driver.execute_query(
+            WARMUP_VECTOR_INDEX,
+            parameters_={"index": index, "vector": probe},
+            database_=NEO4J_DB,
+            routing_=RoutingControl.READ
+        ) for index in VECTOR_INDEXES),
+        return_exceptions=True
+    )
+    for index, result in zip(VECTOR_INDEXES, results):
+        if isinstance(result, Exception):
+            logger.warning(f"   ⚠️ Warmup skipped for {index}: {result}")
+
+    logger.info(f"🔥 Warmup finished in {time.perf_counter() - start:.2f}s")
+
 async def close_driver():
     """Closes the driver connection gracefully."""
     global driver
@@ -73,6 +129,10 @@ async def close_driver():
         await driver.close()
         logger.info("🔒 Neo4j driver closed.")
 
+def has_apoc() -> bool:
+    """True if apoc.periodic.iterate was found on the server at startup."""
+    return APOC_AVAILABLE
+
 def get_driver():
     """
     Returns the raw driver instance.
@@ -80,7 +140,21 @@ def get_driver():
     """
     return driver
 
-async def query(cypher: str, params: dict = None, db: str = None, **kwargs):
+@asynccontextmanager
+async def get_session(db: str = None):
+    """
+    Yields a session bound to the default database (or `db`).
+    Use it when several statements should share one pooled connection
+    instead of each paying for its own session checkout.
+    Sessions are not concurrency-safe: don't share one across gathered tasks.
+    """
+    if not driver:
+        raise ConnectionError("Neo4j driver is not initialized.")
+
+    async with driver.session(database=db or NEO4J_DB) as session:
+        yield session
+
+async def query(cypher: str, params: dict = None, db: str = None, routing: RoutingControl = RoutingControl.WRITE, **kwargs):
     """
     The Recommended Way to run queries.
     Wraps 'execute_query' to provide:
@@ -93,6 +167,9 @@ async def query(cypher: str, params: dict = None, db: str = None, **kwargs):
         params: Dictionary of parameters
         db: (Optional) Override the default database. 
             If None, uses the global NEO4J_DB.
+        routing: (Optional) RoutingControl.READ for read-only queries, so a
+            cluster (e.g. Aura) can serve them from a read replica and
+            keep load off the writer. Defaults to WRITE.
         **kwargs: Alternative parameter specification (keyword conflicts)
     
     Returns:
@@ -105,9 +182,29 @@ async def query(cypher: str, params: dict = None, db: str = None, **kwargs):
         cypher, 
         parameters_=params or {}, 
         database_=db or NEO4J_DB,
+        routing_=routing,
         **kwargs
     )
 
+async def execute_write(statements: list, db: str = None):
+    """
+    Runs several statements inside ONE managed write transaction.
+    Saves a round-trip and a commit per extra statement compared to
+    calling query() repeatedly, and the driver retries the whole unit
+    on transient errors.
+
+    Args:
+        statements: List of (cypher, params) tuples, run in order.
+        db: (Optional) Override the default database.
+    """
+    async def work(tx):
+        for cypher, params in statements:
+            result = await tx.run(cypher, params or {})
+            await result.consume()
+
+    async with get_session(db) as session:
+        await session.execute_write(work)
+
 # --- ISOLATED TESTING ---
 if __name__ == "__main__":
     import asyncio
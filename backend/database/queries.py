@@ -1,6 +1,11 @@
 # Creates the User, Thread, Message, and Source nodes in one atomic transaction
 # Links messages sequentially with :NEXT relationships for easy traversal
 # Links tool calls to their triggering messages and sources for full context
+# Params: $first_msg (first message of the batch) and $pairs, a list of
+# {prev_id, prev_msg_id, next} dicts pre-built in Python so Neo4j doesn't rebuild them.
+# The chain tail is tracked on Thread.last_msg_id, so each new message links to its
+# predecessor with an index seek instead of walking the whole :NEXT chain.
+# A null prev_msg_id means "the tail before this batch" ($last_msg_id is the new tail).
 MERGE_CONVERSATION_TURN = """
     CYPHER 25
 
@@ -12,18 +17,31 @@ MERGE_CONVERSATION_TURN = """
     CALL (*) {
         WHEN existingFirst IS null THEN
             // No messages exist, create the first one
-            MERGE (first:Message {id: $messages[0].id})
+            MERGE (first:Message {id: $first_msg.id})
             ON CREATE SET 
-                first.role = $messages[0].role,
-                first.content = $messages[0].content,
-                first.index = $messages[0].index,
+                first.role = $first_msg.role,
+                first.content = $first_msg.content,
+                first.index = $first_msg.index,
+                first.thread_id = $thread_id,
                 first.created_at = datetime()
             MERGE (t)-[:FIRST]->(first)
     }
 
-    WITH t
-    UNWIND [i IN range(0, size($messages) - 2) | [$messages[i], $messages[i + 1]]] AS pair
-        WITH pair[0] AS msg_0, pair[1] AS msg_1, t
+    // Resolve the tail once per save (falls back to a chain walk for threads saved before the pointer existed)
+    WITH t, CASE WHEN existingFirst IS null THEN $first_msg.id ELSE t.last_msg_id END AS tail_id
+    CALL (t, tail_id) {
+        WHEN tail_id IS NOT null THEN
+            RETURN tail_id AS head_id
+        ELSE
+            OPTIONAL MATCH threadPath = (t)-[:FIRST]->()-[:NEXT]->*(prev)
+            RETURN last(nodes(threadPath)).id AS head_id
+            ORDER BY length(threadPath) DESC LIMIT 1
+    }
+    SET t.last_msg_id = coalesce($last_msg_id, head_id)
+
+    WITH t, head_id
+    UNWIND $pairs AS pair
+        WITH pair.prev_id AS prev_id, coalesce(pair.prev_msg_id, head_id) AS prev_msg_id, pair.next AS msg_1, t
 
         CALL (*) {
             WHEN msg_1.role = "tool" THEN
@@ -51,29 +69,25 @@ MERGE_CONVERSATION_TURN = """
                     m.role = msg_1.role,
                     m.content = msg_1.content,
                     m.index = msg_1.index,
+                    m.thread_id = $thread_id,
                     m.created_at = datetime()
 
-                WITH m, msg_0, t
+                WITH m, prev_id, prev_msg_id
 
-                OPTIONAL MATCH (tc:ToolCall {id: msg_0.id})
-                CALL (*) {
-                    WHEN tc IS NOT null THEN
-                        MERGE (m)-[:TRIGGERED]->(tc)
+                // Link the triggering tool call and copy its sources.
+                // Unit subquery: when prev isn't a ToolCall it simply matches nothing.
+                CALL (m, prev_id) {
+                    MATCH (tc:ToolCall {id: prev_id})
+                    MERGE (m)-[:TRIGGERED]->(tc)
 
-                        WITH m, tc
-                        OPTIONAL MATCH srcPath = (tc)-[:RETRIEVED]->(src:Source)
-                        CALL (*) {
-                            WHEN srcPath IS NOT null THEN
-                                MERGE (m)-[:SOURCED]->(src)
-                        }
+                    WITH m, tc
+                    MATCH (tc)-[:RETRIEVED]->(src:Source)
+                    MERGE (m)-[:SOURCED]->(src)
                 }
 
-                WITH m, t
+                WITH m, prev_msg_id
                 
-                MATCH threadPath = (t)-[:FIRST]->()-[:NEXT]->*(prev)
-                WITH threadPath, length(threadPath) AS pathLength, m
-                ORDER BY pathLength DESC LIMIT 1
-                WITH m, last(nodes(threadPath)) AS prev
+                MATCH (prev:Message {id: prev_msg_id})
                 MERGE (prev)-[:NEXT]->(m)
         }
 """
@@ -90,22 +104,63 @@ FETCH_UNPROCESSED_SOURCES = """
     RETURN s.url AS url, s.text AS text
 """
 
+# Targeted variants: index seeks on the given keys instead of label scans
+FETCH_UNEMBEDDED_MESSAGES_BY_ID = """
+    MATCH (m:Message)
+    WHERE m.id IN $ids AND m.embedding IS null AND m.content IS NOT null
+    RETURN m.id AS id, m.content AS content
+"""
+
+FETCH_UNPROCESSED_SOURCES_BY_URL = """
+    MATCH (s:Source)
+    WHERE s.url IN $urls AND s.text IS NOT NULL AND NOT (s)-[:FIRST]->()
+    RETURN s.url AS url, s.text AS text
+"""
+
+# Stamps each pending Source with its content hash and, when another Source with the
+# same text is already chunked, points it at that chunk chain instead of re-embedding.
+# Params: $rows, a list of {url, hash} dicts. Returns the urls that were linked.
+LINK_DUPLICATE_SOURCES = """
+    UNWIND $rows AS row
+    MATCH (s:Source {url: row.url})
+    SET s.content_hash = row.hash
+    WITH s
+    CALL (s) {
+        MATCH (other:Source {content_hash: s.content_hash})-[:FIRST]->(c0:Chunk)
+        WHERE other <> s
+        RETURN c0 LIMIT 1
+    }
+    MERGE (s)-[:FIRST]->(c0)
+    RETURN s.url AS url
+"""
+
+# Creates chunk nodes, links them into the Source's :FIRST/:NEXT chain and sets
+# their embeddings in ONE round trip.
+# Params: $url and $chunks, a list of {index, text, vector} dicts in index order.
+# Large chunk lists can be sent in consecutive slices: each row links to index - 1,
+# which already exists from an earlier row or slice.
 WRITE_CHUNKS = """
+    CYPHER 25
+
     MATCH (s:Source {url: $url})
     //SET s.text = null // Clear text to save space after chunking
-    MERGE (c0:Chunk {id: s.url + "_0"})
-    ON CREATE SET
-        c0.content = head($chunks).text,
-        c0.index = 0
-    MERGE (s)-[:FIRST]->(c0)
-    WITH s
-    UNWIND [i IN range(0, size($chunks) - 2) | [$chunks[i], $chunks[i + 1]]] AS pair
-    MATCH (prev:Chunk {id: s.url + "_" + toString(pair[0].index)})
-    MERGE (c:Chunk {id: s.url + "_" + toString(pair[1].index)})
+    UNWIND $chunks AS row
+    MERGE (c:Chunk {id: s.url + "_" + toString(row.index)})
     ON CREATE SET
-        c.content = pair[1].text,
-        c.index = pair[1].index
-    MERGE (prev)-[:NEXT]->(c)
+        c.content = row.text,
+        c.index = row.index
+    SET c.embedded_at = datetime()
+    WITH s, c, row
+    CALL db.create.setNodeVectorProperty(c, "embedding", row.vector)
+
+    WITH s, c, row
+    CALL (s, c, row) {
+        WHEN row.index = 0 THEN
+            MERGE (s)-[:FIRST]->(c)
+        ELSE
+            MATCH (prev:Chunk {id: s.url + "_" + toString(row.index - 1)})
+            MERGE (prev)-[:NEXT]->(c)
+    }
 """
 
 WRITE_VECTOR_BATCH = lambda label: f"""
@@ -116,21 +171,60 @@ WRITE_VECTOR_BATCH = lambda label: f"""
     CALL db.create.setNodeVectorProperty(n, "embedding", row.vector)
 """
 
+# Same write via APOC: the server commits every $batch_size rows in parallel inner
+# transactions instead of holding one long transaction over the whole batch.
+# Only used when APOC is installed (see connection.has_apoc).
+WRITE_VECTOR_BATCH_APOC = lambda label: f"""
+    CALL apoc.periodic.iterate(
+        "UNWIND $batch AS row RETURN row",
+        "MATCH (n:{label} {{id: row.id}})
+         SET n.embedded_at = datetime()
+         WITH n, row
+         CALL db.create.setNodeVectorProperty(n, 'embedding', row.vector)",
+        {{batchSize: $batch_size, parallel: true, params: {{batch: $batch}}}}
+    )
+    YIELD batches, failedBatches, errorMessages
+    RETURN batches, failedBatches, errorMessages
+"""
+
+# Used at startup to decide between WRITE_VECTOR_BATCH and WRITE_VECTOR_BATCH_APOC
+CHECK_APOC_ITERATE = """
+    SHOW PROCEDURES YIELD name
+    WHERE name = "apoc.periodic.iterate"
+    RETURN count(*) > 0 AS available
+"""
+
 EP = 0.1
 
-VECTOR_LOOKUP = f"""
-    CALL db.index.vector.queryNodes("messageContent_vector_idx", 3, $vector)
+# Defaults for the vector lookups. Passed as parameters ($k, $min_score) so the
+# Cypher text never changes between calls and the plan cache always hits.
+VECTOR_TOP_K = 3
+VECTOR_MIN_SCORE = 1.0 - EP
+
+# The two lookups are independent, so they're split and run concurrently
+# (see retrieve_context_node). Results are merged and de-duplicated in Python,
+# so neither query pays for a server-side DISTINCT.
+VECTOR_LOOKUP_MSG = """
+    CALL db.index.vector.queryNodes("messageContent_vector_idx", $k, $vector)
     YIELD node, score
     WITH node, score
-    WHERE score > {1.0 - EP}
-    OPTIONAL MATCH (m)-[:NEXT]->{{0,1}}()-[:SOURCED]->(:Source|Chunk)-[:FIRST]->*(n WHERE n.content IS NOT null)
-    RETURN DISTINCT n.id AS id, node.content AS content
-    UNION DISTINCT
-    CALL db.index.vector.queryNodes("chunkContent_vector_idx", 3, $vector)
+    WHERE score > $min_score
+    WITH node, score ORDER BY score DESC LIMIT $k
+    // A message can have many sources: cap the expansion at $k rows per hit,
+    // so the whole lookup returns at most $k * $k rows
+    CALL (node) {
+        OPTIONAL MATCH (node)-[:NEXT]->{0,1}()-[:SOURCED]->(:Source|Chunk)-[:FIRST]->*(n WHERE n.content IS NOT null)
+        RETURN n LIMIT $k
+    }
+    RETURN n.id AS id, node.content AS content
+"""
+
+VECTOR_LOOKUP_CHUNK = """
+    CALL db.index.vector.queryNodes("chunkContent_vector_idx", $k, $vector)
     YIELD node, score
     WITH node, score
-    WHERE score > {1.0 - EP}
-    RETURN DISTINCT node.id AS id, node.content AS content
+    WHERE score > $min_score
+    RETURN node.id AS id, node.content AS content
 """
 
 # New syntax - generating an error for some reason
@@ -159,9 +253,17 @@ VECTOR_LOOKUP = f"""
 #     RETURN content
 # """
 
+# Cheap probe used at startup to page a vector index into memory
+WARMUP_VECTOR_INDEX = """
+    CALL db.index.vector.queryNodes($index, 1, $vector)
+    YIELD node
+    RETURN count(node) AS hits
+"""
+
 LINK_SOURCES_FROM_VECTOR_LOOKUP = """
     MATCH (m:Message {id: $msg_id})
     UNWIND $source_ids AS sid
+    WITH DISTINCT m, sid
 
     // Match loosely (could be a Chunk or a past Message)
     MATCH (src:Chunk|Message {id: sid}) 
@@ -1,21 +1,32 @@
-import hashlib
-import json
+import orjson
+import xxhash
 from pprint import pprint
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage, ToolMessage
 
 # Import from sibling files
-from .connection import query as query_neo4j
+from .connection import execute_write
 from .queries import MERGE_CONVERSATION_TURN, LINK_SOURCES_FROM_VECTOR_LOOKUP
 
 logger = logging.getLogger(__name__)
 
 # --- UTILS (Private) ---
+# Role per message class (None = skip). Exact-type hits avoid the isinstance ladder;
+# subclasses (e.g. AIMessageChunk) fall back to isinstance in _role_of.
+_ROLE_MAP = {HumanMessage: "user", AIMessage: "assistant", ToolMessage: "tool", SystemMessage: None}
+
+def _role_of(msg: BaseMessage) -> Optional[str]:
+    """Maps a LangChain message to the role we store (None = skip)."""
+    msg_type = type(msg)
+    if msg_type in _ROLE_MAP: return _ROLE_MAP[msg_type]
+    for cls, role in _ROLE_MAP.items():
+        if isinstance(msg, cls): return role
+    return "unknown"
+
 def _generate_id(thread_id: str, index: int, role: str, content: str) -> str:
-    safe_content = str(content)[:50]
-    raw = f"{thread_id}-{index}-{role}-{safe_content}"
-    return hashlib.md5(raw.encode("utf-8")).hexdigest()
+    # Non-cryptographic dedup key: xxh3 is much cheaper than md5 on short strings
+    return xxhash.xxh3_128_hexdigest(f"{thread_id}-{index}-{role}-{str(content)[:50]}")
 
 def _clean_content(content: Any) -> str:
     """Sanitizes complex LLM outputs into a clean string."""
@@ -27,27 +38,30 @@ def _clean_content(content: Any) -> str:
             if isinstance(item, str): parts.append(item)
             elif isinstance(item, dict) and "text" in item: parts.append(str(item["text"]))
         return "".join(parts)
-    if isinstance(content, dict): return str(content.get("text", json.dumps(content)))
+    if isinstance(content, dict):
+        if "text" in content: return str(content["text"])
+        # Never raise here: this runs before save_chat_history's try, so a bad tool
+        # payload would abort the whole graph run instead of being stored as text
+        try: return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+        except TypeError: return str(content)
     return str(content)
 
 def _extract_sources(msg: ToolMessage) -> List[Dict]:
     """Parses tool outputs for source URLs."""
-    try:
-        data = msg.content
-        if isinstance(data, str): 
-            try: data = json.loads(data)
-            except: return []
-        
-        if isinstance(data, dict): data = [data]
-        if not isinstance(data, list): return []
+    data = msg.content
+    if isinstance(data, str): 
+        # Plain-text tool output (not JSON) is common: only the decode error is expected here
+        try: data = orjson.loads(data)
+        except orjson.JSONDecodeError: return []
+    
+    if isinstance(data, dict): data = [data]
+    if not isinstance(data, list): return []
 
-        return [{
-            "url": item.get("url"),
-            "title": item.get("title", "No Title"),
-            "content": _clean_content(item.get("content", ""))
-        } for item in data if isinstance(item, dict) and "url" in item]
-    except Exception:
-        return []
+    return [{
+        "url": item.get("url"),
+        "title": item.get("title", "No Title"),
+        "content": _clean_content(item.get("content", ""))
+    } for item in data if isinstance(item, dict) and "url" in item]
 
 # --- PUBLIC API ---
 async def save_chat_history(
@@ -58,55 +72,76 @@ async def save_chat_history(
 ):
     """
     Main entry point to persist a conversation turn.
+    Returns (message_ids, source_urls) of the nodes that may need embedding,
+    or two empty lists if the save failed.
     """
-    serialized_msgs = []
-    current_index = 0
-
+    kept = []
     for msg in messages:
         # 1. Map Role
-        role = "unknown"
-        if isinstance(msg, HumanMessage): role = "user"
-        elif isinstance(msg, AIMessage): role = "assistant"
-        elif isinstance(msg, ToolMessage): role = "tool"
-        elif isinstance(msg, SystemMessage): continue # Skip system messages
+        role = _role_of(msg)
+        if role is None: continue # Skip system messages
         
-        # 2. Clean Data
-        content = _clean_content(msg.content)
+        # 2. Clean Data (plain strings are the common case, skip the call)
+        content = msg.content if type(msg.content) is str else _clean_content(msg.content)
         if not content.strip(): continue
+        kept.append((msg, role, content))
 
-        # 3. Build Object
-        msg_data = {
-            # "id": _generate_id(thread_id, current_index, role, content),
-            "id": msg.id,
-            "index": current_index,
-            "role": role,
-            "content": content if role in ["user", "assistant"] else None, # Only store content for user and assistant
-            "sources": _extract_sources(msg) if role == "tool" else None
-        }
-        serialized_msgs.append(msg_data)
-        current_index += 1
+    # 3. Build Objects
+    serialized_msgs = [{
+        # "id": _generate_id(thread_id, index, role, content),
+        "id": msg.id,
+        "index": index,
+        "role": role,
+        "content": content if role in ("user", "assistant") else None, # Only store content for user and assistant
+        "sources": _extract_sources(msg) if role == "tool" else None
+    } for index, (msg, role, content) in enumerate(kept)]
 
     # 4. Execute Queries
+    # Both statements run in a single transaction (one round-trip, one commit)
+    # Consecutive (prev, next) pairs are built here rather than in Cypher.
+    # prev_msg_id is the previous :NEXT chain member (tool calls aren't in the chain);
+    # None means the batch head, which the query resolves from Thread.last_msg_id.
+    pairs = []
+    prev_msg_id = None
+    for i, (prev, nxt) in enumerate(zip(serialized_msgs, serialized_msgs[1:])):
+        if i > 0 and prev["role"] != "tool":
+            prev_msg_id = prev["id"]
+        pairs.append({"prev_id": prev["id"], "prev_msg_id": prev_msg_id, "next": nxt})
+
+    last_msg_id = next((m["id"] for m in reversed(serialized_msgs[1:]) if m["role"] != "tool"), None)
+
+    statements = [(MERGE_CONVERSATION_TURN, {
+        "user_id": user_id,
+        "thread_id": thread_id,
+        "first_msg": serialized_msgs[0] if serialized_msgs else None,
+        "pairs": pairs,
+        "last_msg_id": last_msg_id
+    })]
+
+    # We assume the LAST AI message in the batch is the one that used the context.
+    # Duplicate ids would only mean wasted MERGEs, so drop them (order preserved).
+    unique_ids = list(dict.fromkeys(context_ids or ()))
+    last_ai_msg = None
+    if unique_ids:
+        # Find the last assistant message in this batch to link
+        last_ai_msg = next((m for m in reversed(serialized_msgs) if m["role"] == "assistant"), None)
+        if last_ai_msg:
+            statements.append((LINK_SOURCES_FROM_VECTOR_LOOKUP, {
+                "msg_id": last_ai_msg["id"],
+                "source_ids": unique_ids
+            }))
+
     try:
-        # Create Nodes
-        await query_neo4j(MERGE_CONVERSATION_TURN, {
-            "user_id": user_id,
-            "thread_id": thread_id,
-            "messages": serialized_msgs
-        })
+        await execute_write(statements)
 
         logger.info(f"✅ Saved {len(serialized_msgs)} messages to thread {thread_id}")
-
-        # We assume the LAST AI message in the batch is the one that used the context.
-        if context_ids:
-            # Find the last assistant message in this batch to link
-            last_ai_msg = next((m for m in reversed(serialized_msgs) if m["role"] == "assistant"), None)
-            
-            if last_ai_msg:
-                await query_neo4j(LINK_SOURCES_FROM_VECTOR_LOOKUP, {
-                    "msg_id": last_ai_msg["id"],
-                    "source_ids": context_ids
-                })
-                logger.info(f"🔗 Linked {len(context_ids)} chunks to message {last_ai_msg['id']}")
+        if last_ai_msg:
+            logger.info(f"🔗 Linked {len(unique_ids)} chunks to message {last_ai_msg['id']}")
     except Exception as e:
-        logger.error(f"❌ DB Save Failed: {e}")
\ No newline at end of file
+        logger.error(f"❌ DB Save Failed: {e}")
+        return [], []
+
+    # Only user/assistant messages carry content to embed
+    message_ids = [m["id"] for m in serialized_msgs if m["content"] is not None]
+    source_urls = list(dict.fromkeys(s["url"] for m in serialized_msgs if m["sources"] for s in m["sources"]))
+    return message_ids, source_urls
\ No newline at end of file
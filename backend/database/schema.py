@@ -1,4 +1,5 @@
 VECTOR_DIM = 384  # Default dimension for Gemini embeddings
+VECTOR_INDEXES = ("messageContent_vector_idx", "chunkContent_vector_idx")
 
 NEO4J_SCHEMA = """
 // --- Constraints (Uniqueness) ---
@@ -11,6 +12,9 @@ FOR (t:Thread) REQUIRE t.id IS NODE KEY;
 CREATE CONSTRAINT msgId_key IF NOT EXISTS 
 FOR (m:Message) REQUIRE m.id IS NODE KEY;
 
+CREATE CONSTRAINT toolCallId_key IF NOT EXISTS 
+FOR (tc:ToolCall) REQUIRE tc.id IS NODE KEY;
+
 CREATE CONSTRAINT sourceUrl_key IF NOT EXISTS 
 FOR (s:Source) REQUIRE s.url IS NODE KEY;
 
@@ -24,18 +28,32 @@ FOR (m:Message) ON (m.created_at);
 CREATE INDEX sourceCrawled_idx IF NOT EXISTS 
 FOR (s:Source) ON (s.crawled_at);
 
+CREATE INDEX sourceHash_idx IF NOT EXISTS 
+FOR (s:Source) ON (s.content_hash);
+
+CREATE INDEX msgThread_idx IF NOT EXISTS 
+FOR (m:Message) ON (m.thread_id);
+
 // --- Vector indexes (Semantic Search) ---
 CREATE VECTOR INDEX messageContent_vector_idx IF NOT EXISTS
 FOR (m:Message) ON (m.embedding)
 OPTIONS {indexConfig: {
     `vector.similarity_function`: "cosine",
-    `vector.dimensions`: 384 // Match your embedding size
+    `vector.dimensions`: 384, // Match your embedding size
+    `vector.quantization.enabled`: true // Server-side int8 quantization (smaller index, faster HNSW)
 }};
 
 CREATE VECTOR INDEX chunkContent_vector_idx IF NOT EXISTS
 FOR (c:Chunk) ON (c.embedding)
 OPTIONS {indexConfig: {
     `vector.similarity_function`: "cosine",
-    `vector.dimensions`: 384 // Match your embedding size
+    `vector.dimensions`: 384, // Match your embedding size
+    `vector.quantization.enabled`: true // Server-side int8 quantization (smaller index, faster HNSW)
 }};
-"""
\ No newline at end of file
+"""
+
+# Split once at import time. Empty fragments are dropped to avoid syntax errors.
+NEO4J_SCHEMA_STATEMENTS = tuple(
+    stmt.strip() for stmt in NEO4J_SCHEMA.split(";")
+    if stmt.strip()
+)
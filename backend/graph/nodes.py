@@ -25,6 +25,10 @@ def make_agent_node(config: AgentConfig, tools: list):
     
     # 2. Bind Tools
     llm_with_tools = llm.bind_tools(tools)
+
+    # Split the template around the date placeholder once, at factory time.
+    # Only the date changes per call, so we just concatenate it in.
+    _pre, _sep, _post = config.system_template.partition("{current_date}")
     
     # 3. Create the Node Function
     async def agent_node(state):
@@ -34,14 +38,13 @@ def make_agent_node(config: AgentConfig, tools: list):
         # Calculate date right now, when the node runs
         current_date = datetime.now().strftime("%B %d, %Y")
         
-        # Format the template
-        system_text = config.system_template.format(
-            current_date=current_date
-        )
+        # Stitch the precomputed template halves around the date
+        system_text = _pre + current_date + _post if _sep else _pre
         
         # Check if System Message exists. If not, prepend it.
         # If it does exist, we could optionally update it, but usually the first one wins.
-        if not messages or not isinstance(messages[0], SystemMessage):
+        # Exact type check: nothing in the graph puts a SystemMessage subclass in state.
+        if not messages or type(messages[0]) is not SystemMessage:
             messages = [SystemMessage(content=system_text)] + messages
         
         # Invoke Model
@@ -1,14 +1,16 @@
+import asyncio
 from langgraph.graph import StateGraph, START, END
 from langgraph.prebuilt import tools_condition, ToolNode
 from langgraph.graph.message import add_messages
 from typing import TypedDict, Annotated, List, Optional
 from langchain_core.messages import SystemMessage
+from neo4j import RoutingControl
 
 # --- IMPORTS (Absolute from backend/ root) ---
 from agent_config import technical_email_config
-from database import query, save_chat_history, VECTOR_LOOKUP
+from database import query, save_chat_history, VECTOR_LOOKUP_MSG, VECTOR_LOOKUP_CHUNK, VECTOR_TOP_K, VECTOR_MIN_SCORE
 from tools import search_web
-from services import embeddings_model
+from services import embeddings_model, enqueue_pending
 
 # --- LOCAL IMPORTS (Sibling) ---
 from .nodes import make_agent_node
@@ -35,22 +37,35 @@ async def retrieve_context_node(state: AgentState):
 
     # 1. Generate Embedding
     # We use aembed_query (optimized for search queries) vs aembed_documents (for storage)
+    # Both lookups below need this vector, so this await can't overlap with them.
+    # (The lookups themselves are independent and run concurrently.)
     query_vector = await embeddings_model.aembed_query(user_query)
     
     # 2. Run Vector Search
-    # Note: Ensure your index name 'messageContent_vector_idx' exists in the DB.
+    # Note: Ensure the indexes 'messageContent_vector_idx' and 'chunkContent_vector_idx' exist in the DB.
+    # Both index lookups are independent, so we run them concurrently (one session each).
+    # The vector is passed through as the plain list of floats Gemini returns:
+    # PackStream encodes every Python float as a 64-bit float either way.
+    params = {"vector": query_vector, "k": VECTOR_TOP_K, "min_score": VECTOR_MIN_SCORE}
     
     try:
-        result = await query(VECTOR_LOOKUP, {
-            "vector": query_vector
-        })
-        
+        msg_result, chunk_result = await asyncio.gather(
+            query(VECTOR_LOOKUP_MSG, params, routing=RoutingControl.READ),
+            query(VECTOR_LOOKUP_CHUNK, params, routing=RoutingControl.READ)
+        )
+
         # 3. Process Results
-        contents = []
-        if result.records:
-            # The query returns a `content` field which is a list of relevant past messages (could be empty)
-            source_ids = [record["id"] for record in result.records if record["content"]]
-            contents = [result["content"] for result in result.records if result["content"]]
+        # Single pass: merge both branches, de-duplicate rows (like the old UNION DISTINCT)
+        # and collect ids + contents together. Rows without content are skipped.
+        source_ids, contents, seen = [], [], set()
+        for record in msg_result.records + chunk_result.records:
+            content = record["content"]
+            key = (record["id"], content)
+            if not content or key in seen:
+                continue
+            seen.add(key)
+            source_ids.append(record["id"])
+            contents.append(content)
         
         if contents:
             context_text = "\n---\n".join(contents)
@@ -95,12 +110,14 @@ def build_graph():
     # 4. Define Memory Node
     async def memory_node(state: AgentState):
         # TODO: Pass user_id context properly
-        await save_chat_history(
+        message_ids, source_urls = await save_chat_history(
             user_id="user_default",
             thread_id=state["thread_id"],
             messages=state["messages"],
             context_ids=state.get("context_ids", [])
         )
+        # Hand the new nodes to the background embedder (no graph-wide scan)
+        enqueue_pending(message_ids, source_urls)
         return {}
         
     builder.add_node("memory", memory_node)
@@ -1,12 +1,21 @@
 import os
+import logging
 from dotenv import load_dotenv
 import asyncio
 
 # Load environment variables from .env file
 load_dotenv()
 
+# The entrypoint owns logging config (modules only call getLogger)
+# LOG_LEVEL defaults to INFO so request, warmup and pool logs are visible
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger(__name__)
+
 from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import BackgroundTasks
@@ -15,15 +24,21 @@ from contextlib import asynccontextmanager
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from pydantic import BaseModel
 from typing import List
-from datetime import datetime
 
 from database import init_driver, close_driver, query as query_neo4j
 from graph import build_graph
-from services.embedder import process_pending_nodes
+from services import start_maintenance_worker, stop_maintenance_worker
+from tools import close_search_client
 
 # --- GLOBAL GRAPH INSTANCE ---
 app_graph = None
 
+# Max text chunks buffered between the graph run and the client socket
+STREAM_QUEUE_SIZE = 256
+# Tokens are coalesced until either limit is hit, then sent as one chunk
+STREAM_FLUSH_CHARS = 4096
+STREAM_FLUSH_INTERVAL = 0.02  # seconds
+
 # --- LIFESPAN MANAGER ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -38,6 +53,10 @@ async def lifespan(app: FastAPI):
     global app_graph
     app_graph = build_graph()
 
+    # Start the single background maintenance worker
+    # (the graph's memory node feeds it the ids of newly saved nodes)
+    start_maintenance_worker()
+
     # --- PHASE 2: THE PAUSE BUTTON (YIELD) ---
     # The application "pauses" here and goes to work.
     # It stays in this state for days/weeks, serving user requests.
@@ -47,10 +66,12 @@ async def lifespan(app: FastAPI):
     # This code runs ONE TIME when you press 'Ctrl+C' (stop uvicorn).
     # It ensures you close the database connection safely before the process dies.
     print("🛑 App is shutting down...")
+    await stop_maintenance_worker()
+    await close_search_client()
     await close_driver()
 
 # create app instance
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 # CORS (Allow frontend to talk to backend)
 app.add_middleware(
     CORSMiddleware,
@@ -75,7 +96,8 @@ class ChatRequest(BaseModel):
 @app.get("/health_check")
 async def health_check():
     """Health check endpoint to verify the service is running."""
-    return {"status": "Hello, World!"}
+    # Returned directly so FastAPI skips jsonable_encoder (hit often by load balancers)
+    return ORJSONResponse({"status": "Hello, World!"})
 
 # --- THE ENDPOINT ---
 @app.post("/stream")
@@ -84,7 +106,8 @@ async def stream_chat(request: ChatRequest):
     The main chat endpoint.
     It purely handles I/O. The Logic is all in the Graph.
     """
-    print(f"Received request with {len(request.messages)} messages at {datetime.now().isoformat()}")
+    # Lazy %-args: nothing is formatted unless INFO is enabled (timestamp comes from the formatter)
+    logger.info("Received request with %d messages", len(request.messages))
     
     # 1. Convert Frontend JSON -> LangChain Messages
     # CRITICAL CHANGE: We do NOT inject the System Prompt here anymore.
@@ -103,33 +126,85 @@ async def stream_chat(request: ChatRequest):
         if not app_graph:
             yield "Error: Graph not initialized."
             return
-            
-        # Stream events from the graph
-        async for event in app_graph.astream_events(
-            {"messages": history, "thread_id": request.threadId}, 
-            version="v1"
-        ):
-            kind = event["event"]
-            
-            # "on_chat_model_stream" is when the LLM is writing text
-            if kind == "on_chat_model_stream":
-                chunk = event["data"]["chunk"]
-                content = chunk.content
-                
-                if content:
-                    # Robust handling for string vs list content
-                    if isinstance(content, str):
-                        yield content
-                    elif isinstance(content, list):
-                         for block in content:
-                            if isinstance(block, str):
-                                yield block
-                            elif isinstance(block, dict) and "text" in block:
-                                yield block["text"]
-            
-        asyncio.create_task(process_pending_nodes())
 
-    return StreamingResponse(generate(), media_type="text/plain")
+        # The graph runs in its own task and pushes text into a bounded queue.
+        # A slow client socket then only fills the queue instead of stalling
+        # the LLM/tool loop on every send.
+        queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+        async def produce():
+            try:
+                # Stream events from the graph
+                async for event in app_graph.astream_events(
+                    {"messages": history, "thread_id": request.threadId}, 
+                    version="v1"
+                ):
+                    kind = event["event"]
+                    
+                    # "on_chat_model_stream" is when the LLM is writing text
+                    if kind == "on_chat_model_stream":
+                        chunk = event["data"]["chunk"]
+                        content = chunk.content
+                        
+                        if content:
+                            # Robust handling for string vs list content
+                            if isinstance(content, str):
+                                await queue.put(content)
+                            elif isinstance(content, list):
+                                for block in content:
+                                    if isinstance(block, str):
+                                        await queue.put(block)
+                                    elif isinstance(block, dict) and "text" in block:
+                                        await queue.put(block["text"])
+            except asyncio.CancelledError:
+                # The client is gone: nobody will drain a marker, and a put on a
+                # full queue would block this task forever
+                raise
+            except Exception:
+                await queue.put(None) # Let the consumer stop; `await producer` re-raises
+                raise
+            await queue.put(None) # End-of-stream marker
+
+        producer = asyncio.create_task(produce())
+        loop = asyncio.get_running_loop()
+        try:
+            finished = False
+            while not finished:
+                text = await queue.get()
+                if text is None:
+                    break
+
+                # Coalesce: keep collecting tokens until the buffer is big enough
+                # or the flush window closes, so we send one chunk per burst
+                # rather than one per token.
+                buffer, size = [text], len(text)
+                deadline = loop.time() + STREAM_FLUSH_INTERVAL
+                while size < STREAM_FLUSH_CHARS:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        text = await asyncio.wait_for(queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    if text is None:
+                        finished = True
+                        break
+                    buffer.append(text)
+                    size += len(text)
+
+                yield "".join(buffer)
+            await producer # Surface any error raised by the graph run
+        finally:
+            # Client went away (or we're done): stop the graph run
+            producer.cancel()
+
+    # Tell reverse proxies (nginx: X-Accel-Buffering) and caches not to buffer the stream
+    return StreamingResponse(
+        generate(),
+        media_type="text/plain",
+        headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"}
+    )
 
 @app.get("/api/test-db")
 async def test_db():
@@ -137,9 +212,9 @@ async def test_db():
         # Use our new helper function
         result = await query_neo4j("RETURN 'Hello from Aura!' AS message")
         record = result.records[0]
-        return {"status": "success", "message": record["message"]}
+        return ORJSONResponse({"status": "success", "message": record["message"]})
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return ORJSONResponse({"status": "error", "message": str(e)})
 
 # --- STATIC FILES ---
 # Mount the frontend if it exists
@@ -1,17 +1,15 @@
-import json
-import hashlib
 import logging
-from datetime import datetime
-from typing import List, Dict, Any
+import orjson
+import xxhash
+from typing import List, Dict, Any, Optional
 
 # LangChain Imports
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage, BaseMessage
 
 # Local Imports
-from db import get_driver, query as query_neo4j
+from database import get_driver, execute_write
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Logging is configured by the entrypoint (main.py)
 logger = logging.getLogger(__name__)
 
 def generate_message_id(thread_id: str, index: int, role: str, content: str) -> str:
@@ -20,9 +18,19 @@ def generate_message_id(thread_id: str, index: int, role: str, content: str) ->
     Ensures that if we save the same conversation twice, we don't create duplicate nodes.
     """
     # Take the first 50 chars to keep the hash stable even if tail content changes slightly
-    safe_content = str(content)[:50] 
-    raw_str = f"{thread_id}-{index}-{role}-{safe_content}"
-    return hashlib.md5(raw_str.encode("utf-8")).hexdigest()
+    # xxh3 (non-cryptographic) is plenty for a MERGE dedup key and much cheaper than md5
+    return xxhash.xxh3_128_hexdigest(f"{thread_id}-{index}-{role}-{str(content)[:50]}")
+
+# Keys that carry the human-readable part of a dict payload, in priority order
+_TEXT_KEYS = ("text", "output", "content", "input")
+
+def _dict_text(item: dict) -> Optional[str]:
+    """Returns the first known text field of a dict payload, or None."""
+    for key in _TEXT_KEYS:
+        if key in item:
+            value = item[key]
+            return value if isinstance(value, str) else orjson.dumps(value, default=str).decode()
+    return None
 
 def clean_content(content: Any) -> str:
     """
@@ -41,21 +49,23 @@ def clean_content(content: Any) -> str:
 
     # 2. List (Stream Chunks or Tool Calls)
     if isinstance(content, list):
-        text_parts = []
-        for item in content:
-            if isinstance(item, str):
-                text_parts.append(item)
-            elif isinstance(item, dict):
-                # If it has a 'text' key, use it. Ignore 'extras', 'signature', etc.
-                if "text" in item:
-                    text_parts.append(str(item["text"]))
-        # Join all text parts found
-        return "".join(text_parts)
+        # Fast path: plain string chunks join directly
+        if all(isinstance(item, str) for item in content):
+            return "".join(content)
+        # Mixed: dicts contribute their first known text key. Ignore 'extras', 'signature', etc.
+        return "".join(
+            part for part in (
+                item if isinstance(item, str) else _dict_text(item) if isinstance(item, dict) else None
+                for item in content
+            )
+            if part is not None
+        )
 
     # 3. Dict (Tool Call Payload)
     if isinstance(content, dict):
-        # If it has text, return it. Otherwise, JSON dump it so we don't lose the data.
-        return str(content.get("text", json.dumps(content)))
+        # If it has a text-like field, return it. Otherwise, JSON dump it so we don't lose the data.
+        text = _dict_text(content)
+        return text if text is not None else orjson.dumps(content, default=str).decode()
 
     # 4. Fallback
     return str(content)
@@ -69,13 +79,13 @@ def extract_sources(msg: ToolMessage) -> List[Dict[str, str]]:
         content = msg.content
         data = []
 
-        # Parse JSON if needed
+        # Parse JSON if needed (already-structured content is used as-is)
         if isinstance(content, str):
             try:
-                data = json.loads(content)
-            except json.JSONDecodeError:
+                data = orjson.loads(content)
+            except orjson.JSONDecodeError:
                 return [] # Not JSON, probably just an error string
-        elif isinstance(content, list):
+        elif isinstance(content, (list, dict)):
             data = content
         
         # Normalize to list if it's a single dict
@@ -85,10 +95,13 @@ def extract_sources(msg: ToolMessage) -> List[Dict[str, str]]:
         valid_sources = []
         for item in data:
             if isinstance(item, dict) and "url" in item:
+                raw = item.get("content", "")
+                if isinstance(raw, str):
+                    raw = raw[:500] # Truncate BEFORE cleaning so we don't process multi-KB pages
                 valid_sources.append({
                     "url": item["url"],
                     "title": item.get("title", "No Title"),
-                    "content": clean_content(item.get("content", ""))[:500] # Truncate for sanity
+                    "content": clean_content(raw)[:500] # Truncate for sanity
                 })
         return valid_sources
 
@@ -169,33 +182,28 @@ async def persist_chat(user_id: str, thread_id: str, messages: List[BaseMessage]
             s.crawled_at = datetime()
         MERGE (m)-[:RETRIEVED]->(s)
     )
+
+    // Chain Linking (pairs are pre-computed from the ordered batch)
+    WITH count(*) AS _
+    UNWIND $pairs AS p
+    MATCH (a:Message {id: p.a}), (b:Message {id: p.b})
+    MERGE (a)-[:NEXT]->(b)
     """
-    
-    # --- CHAIN LINKING QUERY (Separate for cleanliness) ---
-    chain_query = """
-    MATCH (t:Thread {id: $thread_id})-[:HAS_MESSAGE]->(m:Message)
-    WITH m ORDER BY m.index ASC
-    WITH collect(m) AS messages
-    FOREACH (i IN range(0, size(messages)-2) |
-        FOREACH (curr IN [messages[i]] |
-            FOREACH (next IN [messages[i+1]] |
-                MERGE (curr)-[:NEXT]->(next)
-            )
-        )
-    )
-    """
+
+    # serialized_messages is already in order, so consecutive entries are the NEXT links
+    pairs = [
+        {"a": serialized_messages[i]["id"], "b": serialized_messages[i + 1]["id"]}
+        for i in range(len(serialized_messages) - 1)
+    ]
 
     try:
-        # Execute Query using the query fn from db.py
-        await query_neo4j(query, {
+        # One statement, one managed write transaction (single round trip + commit)
+        await execute_write([(query, {
             "user_id": user_id, 
             "thread_id": thread_id, 
-            "messages": serialized_messages
-        })
-
-        await query_neo4j(chain_query, {
-            "thread_id": thread_id
-        })
+            "messages": serialized_messages,
+            "pairs": pairs
+        })])
 
         logger.info(f"✅ Persisted {len(serialized_messages)} messages to Neo4j.")
         
@@ -1,7 +1,11 @@
 # Expose the Connection components
 from .embedder import process_pending_nodes, embeddings_model
+from .maintenance import enqueue_pending, start_maintenance_worker, stop_maintenance_worker
 
 __all__ = [
     "process_pending_nodes",
-    "embeddings_model"
+    "embeddings_model",
+    "enqueue_pending",
+    "start_maintenance_worker",
+    "stop_maintenance_worker"
 ]
\ No newline at end of file
@@ -1,12 +1,15 @@
 # backend/services/embedder.py
 import os
+import math
+import asyncio
 import logging
-from typing import List
+import xxhash
+from typing import List, Optional
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 # Import database tools
-from database import query, FETCH_UNEMBEDDED_MESSAGES, FETCH_UNPROCESSED_SOURCES, WRITE_VECTOR_BATCH, WRITE_CHUNKS, VECTOR_DIM
+from database import query, has_apoc, FETCH_UNEMBEDDED_MESSAGES, FETCH_UNPROCESSED_SOURCES, FETCH_UNEMBEDDED_MESSAGES_BY_ID, FETCH_UNPROCESSED_SOURCES_BY_URL, WRITE_VECTOR_BATCH, WRITE_VECTOR_BATCH_APOC, WRITE_CHUNKS, LINK_DUPLICATE_SOURCES, VECTOR_DIM
 
 logger = logging.getLogger(__name__)
 
@@ -18,76 +21,164 @@ embeddings_model = GoogleGenerativeAIEmbeddings(
 )
 
 # Initialize Splitter (for Web Pages)
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=200,
+# Built once at import; lengths are measured in tokens (one cached tiktoken encoder).
+# cl100k_base is OpenAI's tokenizer, not Gemini's, so counts are only an approximation
+# of the embedding model's tokens. ~250 tokens is roughly the old 1000-character chunk.
+# The encoding file is fetched on first use; the Docker image pre-caches it (TIKTOKEN_CACHE_DIR).
+text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+    encoding_name="cl100k_base",
+    chunk_size=250,
+    chunk_overlap=50,
     separators=["\n\n", "\n", ".", " ", ""]
 )
 
-BATCH_SIZE = 50
+BATCH_SIZE = 500
+EMBED_MAX_ITEMS = 2048  # Max texts sent in one aembed_documents call
+WRITE_CHUNKS_BATCH = 500  # Max chunks per WRITE_CHUNKS call (keeps Bolt messages small)
 
-async def process_pending_nodes():
+# Caps concurrent Neo4j writes from the maintenance job.
+# Keep the driver's pool (NEO4J_POOL, default 64) at >= 2x this.
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "8"))
+SEM = asyncio.Semaphore(EMBED_CONCURRENCY)
+
+async def _bounded(coro):
+    """Awaits `coro` while holding a SEM slot."""
+    async with SEM:
+        return await coro
+
+def _normalize(vectors: List[List[float]]) -> List[List[float]]:
+    """
+    L2-normalizes each vector. Gemini only returns unit vectors at full size,
+    so truncated (VECTOR_DIM) outputs need this before going into the index.
+    """
+    normalized = []
+    for vector in vectors:
+        norm = math.hypot(*vector) or 1.0
+        normalized.append([x / norm for x in vector])
+    return normalized
+
+async def _embed_all(texts: List[str]) -> List[List[float]]:
+    """Embeds texts in as few calls as possible (super-batches of EMBED_MAX_ITEMS)."""
+    vectors = []
+    for i in range(0, len(texts), EMBED_MAX_ITEMS):
+        vectors.extend(await embeddings_model.aembed_documents(texts[i:i + EMBED_MAX_ITEMS]))
+    return _normalize(vectors)
+
+async def process_pending_nodes(message_ids: Optional[List[str]] = None, source_urls: Optional[List[str]] = None):
     """
     The Main Maintenance Job.
     1. Finds Messages without embeddings.
-    2. Finds Sources that haven't been chunked.
+    2. Finds Sources that haven't been chunked, and chunks them.
+    3. Embeds messages + every chunk together, then writes everything back.
+
+    With no arguments the whole graph is scanned. Pass the ids/urls of freshly
+    saved nodes to only look at those.
     """
     logger.info("🧹 Starting Maintenance: Embeddings & Chunking...")
     
-    # --- A. PROCESS MESSAGES ---
-    # Find messages with content but NO embedding
-    records = await query(FETCH_UNEMBEDDED_MESSAGES)
+    # --- A. FIND PENDING WORK ---
+    # Messages with content but NO embedding, and sources with text but NO chunks connected
+    if message_ids is None and source_urls is None:
+        fetches = (query(FETCH_UNEMBEDDED_MESSAGES), query(FETCH_UNPROCESSED_SOURCES))
+    else:
+        fetches = (
+            query(FETCH_UNEMBEDDED_MESSAGES_BY_ID, {"ids": list(message_ids or ())}),
+            query(FETCH_UNPROCESSED_SOURCES_BY_URL, {"urls": list(source_urls or ())})
+        )
+    msg_records, source_records = await asyncio.gather(*fetches)
+    messages = msg_records.records
 
-    if records.records:
-        logger.info(f"embedding {len(records.records)} messages...")
-        
-        # Batch Embed
-        texts = [r["content"] for r in records.records]
-        vectors = await embeddings_model.aembed_documents(texts)
-        
-        # Write Back
-        # We use UNWIND to do this in one DB call per batch
-        # Assume multiple batches of size BATCH_SIZE
-        updates = [{"id": r["id"], "vector": v} for r, v in zip(records.records, vectors)]
+    # Skip pages whose exact text is already chunked under another URL:
+    # those are linked to the existing chunk chain instead of being re-embedded.
+    hashes = {r["url"]: xxhash.xxh3_64_hexdigest(r["text"]) for r in source_records.records}
+    reused = set()
+    if hashes:
+        linked = await query(LINK_DUPLICATE_SOURCES, {"rows": [{"url": u, "hash": h} for u, h in hashes.items()]})
+        reused = {r["url"] for r in linked.records}
+
+    # Split every source up front so all texts can be embedded together
+    # (identical pages within this pass are only chunked once)
+    sources = []
+    seen_hashes = set()
+    duplicates = []
+    for record in source_records.records:
+        url = record["url"]
+        if url in reused:
+            continue
+        if hashes[url] in seen_hashes:
+            duplicates.append({"url": url, "hash": hashes[url]})
+            continue
+        seen_hashes.add(hashes[url])
+
+        logger.info(f"📄 Chunking Source: {record['url']}")
+        chunks = text_splitter.split_text(record["text"])
+        if chunks:
+            sources.append((record["url"], chunks))
+
+    # --- B. EMBED EVERYTHING IN ONE GO ---
+    # Messages first, then each source's chunks; offsets let us slice vectors back out.
+    all_texts = [r["content"] for r in messages]
+    offsets = []
+    for _, chunks in sources:
+        offsets.append(len(all_texts))
+        all_texts.extend(chunks)
+
+    if not all_texts:
+        logger.info("✨ Maintenance Complete.")
+        return
+
+    logger.info(f"embedding {len(messages)} messages and {len(all_texts) - len(messages)} chunks...")
+    vectors = await _embed_all(all_texts)
+
+    # --- C. WRITE BACK ---
+    writes = []
+    updates = [{"id": r["id"], "vector": v} for r, v in zip(messages, vectors)]
+    if updates and has_apoc():
+        # One call; APOC commits every BATCH_SIZE rows server-side, in parallel
+        writes.append(_write_vectors_apoc("Message", updates))
+    else:
+        # We use UNWIND to do this in one DB call per batch of BATCH_SIZE
         for i in range(0, len(updates), BATCH_SIZE):
-            batch = updates[i:i + BATCH_SIZE]
-            await query(WRITE_VECTOR_BATCH("Message"), {"batch": batch})
+            writes.append(query(WRITE_VECTOR_BATCH("Message"), {"batch": updates[i:i + BATCH_SIZE]}))
 
-    # --- B. PROCESS SOURCES (CHUNKING) ---
-    # Find sources that have text but NO chunks connected
-    source_records = await query(FETCH_UNPROCESSED_SOURCES)
+    for (url, chunks), offset in zip(sources, offsets):
+        writes.append(_store_source_chunks(url, chunks, vectors[offset:offset + len(chunks)]))
 
-    for record in source_records.records:
-        await _chunk_and_store_source(record["url"], record["text"])
+    # Sources are independent, so write them in parallel (bounded by SEM)
+    await asyncio.gather(*(_bounded(write) for write in writes))
+
+    # Same-text pages from this pass can now point at the chunks just written
+    if duplicates:
+        await query(LINK_DUPLICATE_SOURCES, {"rows": duplicates})
         
     logger.info("✨ Maintenance Complete.")
 
-async def _chunk_and_store_source(url: str, text: str):
+async def _write_vectors_apoc(label: str, updates: List[dict]):
     """
-    Splits text into chunks, embeds them, and saves to Neo4j.
+    Writes vectors via WRITE_VECTOR_BATCH_APOC.
+    apoc.periodic.iterate reports failed inner batches instead of raising,
+    so we raise here to make the maintenance pass fail (and be retried).
     """
-    logger.info(f"📄 Chunking Source: {url}")
-    
-    # 1. Split Text
-    chunks = text_splitter.split_text(text)
-    if not chunks:
-        return
+    result = await query(WRITE_VECTOR_BATCH_APOC(label), {"batch": updates, "batch_size": BATCH_SIZE})
+    record = result.records[0]
+    if record["failedBatches"]:
+        raise RuntimeError(
+            f"Vector write failed for {record['failedBatches']}/{record['batches']} "
+            f"{label} batches: {record['errorMessages']}"
+        )
 
-    # 2. Embed Chunks
-    vectors = await embeddings_model.aembed_documents(chunks)
-    
-    # 3. Prepare Data for Cypher
-    chunk_data = []
-    for i, (chunk_text, vector) in enumerate(zip(chunks, vectors)):
-        chunk_data.append({
-            "index": i,
-            "text": chunk_text,
-            "vector": vector
-        })
-
-    # 4. Save to Graph (Linear Chain Pattern)
-    await query(WRITE_CHUNKS, {"url": url, "chunks": [{"index": chunk["index"], "text": chunk["text"]} for chunk in chunk_data]})
-    # 5. Save Embeddings (Separate Query to set vectors after nodes are created)
-    for i in range(0, len(chunk_data), BATCH_SIZE):
-        batch = [{"id": f"{url}_{chunk['index']}", "vector": chunk["vector"]} for chunk in chunk_data[i:i + BATCH_SIZE]]
-        await query(WRITE_VECTOR_BATCH("Chunk"), {"batch": batch})
+async def _store_source_chunks(url: str, chunks: List[str], vectors: List[List[float]]):
+    """
+    Saves a source's (already embedded) chunks to Neo4j.
+    Nodes, chain links and vectors go out together, one query per WRITE_CHUNKS_BATCH.
+    """
+    # 1. Prepare Data for Cypher
+    chunk_data = [
+        {"index": i, "text": chunk_text, "vector": vector}
+        for i, (chunk_text, vector) in enumerate(zip(chunks, vectors))
+    ]
+
+    # 2. Save to Graph (Linear Chain Pattern)
+    # Slices must run in order: each chunk links to the one before it
+    for i in range(0, len(chunk_data), WRITE_CHUNKS_BATCH):
+        await query(WRITE_CHUNKS, {"url": url, "chunks": chunk_data[i:i + WRITE_CHUNKS_BATCH]})
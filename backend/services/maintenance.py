@@ -0,0 +1,120 @@
+# backend/services/maintenance.py
+import asyncio
+import logging
+import os
+import tempfile
+from typing import Iterable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, dev runs are single-process anyway
+    fcntl = None
+
+from .embedder import process_pending_nodes
+
+logger = logging.getLogger(__name__)
+
+# --- BACKGROUND MAINTENANCE ---
+# New nodes are pushed here as they're saved (see memory_node) instead of each
+# request triggering a full graph scan. One worker drains the queue, coalesces
+# bursts and embeds only the queued ids.
+MAINTENANCE_QUEUE_SIZE = 256
+MAINTENANCE_DELAY = 2  # seconds to collect a burst before running a pass
+MAINTENANCE_RETRY_DELAY = 60  # seconds before a failed pass is retried without new traffic
+# Full catch-up scan on startup (ids queued at shutdown or dropped by a failed pass).
+# Every uvicorn worker runs its own maintenance worker, so the workers on a host
+# elect one scanner through an exclusive lock on this file (held until shutdown).
+MAINTENANCE_STARTUP_SCAN = os.getenv("MAINTENANCE_STARTUP_SCAN", "1") == "1"
+MAINTENANCE_LOCK_FILE = os.getenv(
+    "MAINTENANCE_LOCK_FILE", os.path.join(tempfile.gettempdir(), "maintenance-scan.lock")
+)
+
+_queue: Optional[asyncio.Queue] = None
+_worker: Optional[asyncio.Task] = None
+_overflowed = False # Set when the queue was full; the next pass does a full scan
+_scan_lock = None # Open lock file while this process is the elected scanner
+
+def _claim_startup_scan() -> bool:
+    """Returns True if this process won the startup scan (first to lock the file)."""
+    global _scan_lock
+    if fcntl is None:
+        return True
+    lock_file = open(MAINTENANCE_LOCK_FILE, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _scan_lock = lock_file
+    return True
+
+def enqueue_pending(message_ids: Iterable[str], source_urls: Iterable[str]):
+    """Queues freshly saved Message ids / Source urls for embedding. Never blocks."""
+    global _overflowed
+    message_ids, source_urls = list(message_ids), list(source_urls)
+    if _queue is None or not (message_ids or source_urls):
+        return
+    try:
+        _queue.put_nowait((message_ids, source_urls))
+    except asyncio.QueueFull:
+        _overflowed = True
+
+async def _run_pass(message_ids=None, source_urls=None):
+    global _overflowed
+    try:
+        await process_pending_nodes(message_ids, source_urls)
+    except Exception as e:
+        # The ids of a failed pass are gone from the queue: rescan on the next pass
+        _overflowed = True
+        logger.warning(f"⚠️ Maintenance pass failed: {e}")
+
+async def _maintenance_worker(queue: asyncio.Queue):
+    """Runs one targeted process_pending_nodes() pass per burst of queued nodes."""
+    global _overflowed
+
+    # Catch up on anything left unprocessed by a previous run (one full scan)
+    if MAINTENANCE_STARTUP_SCAN and _claim_startup_scan():
+        await _run_pass()
+
+    while True:
+        # After a failed pass, retry on a timer instead of waiting for new traffic
+        try:
+            message_ids, source_urls = await asyncio.wait_for(
+                queue.get(), MAINTENANCE_RETRY_DELAY if _overflowed else None
+            )
+        except asyncio.TimeoutError:
+            message_ids, source_urls = [], []
+        await asyncio.sleep(MAINTENANCE_DELAY)
+
+        # Everything queued during the delay is covered by this pass
+        message_ids, source_urls = set(message_ids), set(source_urls)
+        while not queue.empty():
+            ids, urls = queue.get_nowait()
+            message_ids.update(ids)
+            source_urls.update(urls)
+
+        if _overflowed:
+            # Some ids were dropped (queue full or failed pass): fall back to a scan
+            _overflowed = False
+            await _run_pass()
+        else:
+            await _run_pass(list(message_ids), list(source_urls))
+
+def start_maintenance_worker():
+    """Starts the background worker. Call once from the app lifespan."""
+    global _queue, _worker
+    _queue = asyncio.Queue(maxsize=MAINTENANCE_QUEUE_SIZE)
+    _worker = asyncio.create_task(_maintenance_worker(_queue))
+
+async def stop_maintenance_worker():
+    """Cancels the background worker and waits for it to exit."""
+    global _queue, _worker, _scan_lock
+    if _worker:
+        _worker.cancel()
+        try:
+            await _worker
+        except asyncio.CancelledError:
+            pass
+    if _scan_lock:
+        _scan_lock.close()  # Releases the flock
+    _queue, _worker, _scan_lock = None, None, None
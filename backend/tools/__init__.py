@@ -1,6 +1,7 @@
 # Expose the Connection components
-from .search import search_web
+from .search import search_web, close_search_client
 
 __all__ = [
-    "search_web"
+    "search_web",
+    "close_search_client"
 ]
\ No newline at end of file
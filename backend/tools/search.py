@@ -1,8 +1,11 @@
 import os
+import time
+import asyncio
 import logging
-from typing import List, TypedDict, Optional
+from collections import OrderedDict
+from typing import Dict, List, TypedDict, Optional
+import httpx
 from langchain_core.tools import tool
-from tavily import TavilyClient
 
 # --- 1. DEFINE THE SHAPE ---
 # We explicitly define what a "Source" looks like.
@@ -13,13 +16,90 @@ class SearchResult(TypedDict):
     content: str
     score: float
 
-# Configure logging to keep the console clean but informative
-logging.basicConfig(level=logging.INFO)
+# Logging is configured by the entrypoint (main.py)
 logger = logging.getLogger(__name__)
 
-# --- 2. THE TOOL ---
+# One pooled async client for the whole process: connections (and TLS sessions)
+# are reused across searches, and requests never block the event loop.
+_http: Optional[httpx.AsyncClient] = None
+
+def _get_http() -> httpx.AsyncClient:
+    """Returns the shared HTTP client, (re)creating it after close_search_client()."""
+    global _http
+    if _http is None or _http.is_closed:
+        _http = httpx.AsyncClient(
+            base_url="https://api.tavily.com",
+            timeout=15,
+            limits=httpx.Limits(max_connections=64)
+        )
+    return _http
+
+async def close_search_client():
+    """Closes the shared HTTP client. Call on app shutdown."""
+    global _http
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+
+# --- 2. RESULT CACHE ---
+# Identical searches are common within and across conversations, so results are
+# kept in a small LRU with a TTL. Only successful searches are cached.
+SEARCH_CACHE_SIZE = 2048
+SEARCH_CACHE_TTL = 3600  # seconds
+
+_cache: "OrderedDict[tuple, tuple[float, List[SearchResult]]]" = OrderedDict()
+_locks: Dict[tuple, asyncio.Lock] = {}
+_lock_users: Dict[tuple, int] = {}  # holder + waiters per lock; the last one out drops it
+
+def _cache_get(key: tuple) -> Optional[List[SearchResult]]:
+    entry = _cache.get(key)
+    if entry is None:
+        return None
+    expires_at, results = entry
+    if expires_at < time.monotonic():
+        del _cache[key]
+        return None
+    _cache.move_to_end(key)
+    return results
+
+def _cache_put(key: tuple, results: List[SearchResult]):
+    _cache[key] = (time.monotonic() + SEARCH_CACHE_TTL, results)
+    _cache.move_to_end(key)
+    while len(_cache) > SEARCH_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+async def _fetch_results(api_key: str, targeted_query: str, max_results: int) -> List[SearchResult]:
+    """Calls Tavily and normalizes the response. Raises on HTTP errors."""
+    response = await _get_http().post(
+        "/search",
+        headers={"Authorization": f"Bearer {api_key}"},
+        json={
+            "query": targeted_query,
+            "search_depth": "advanced",
+            "max_results": max_results,
+            "include_raw_content": False # We want the AI-summarized 'content', not HTML
+        }
+    )
+    response.raise_for_status()
+    data = response.json()
+    
+    # --- NORMALIZE THE OUTPUT ---
+    # Map the raw API response to our strict SearchResult schema
+    results: List[SearchResult] = []
+    
+    for result in data.get("results", []):
+        # Handle potential missing keys safely
+        results.append({
+            "title": result.get("title", "No Title"),
+            "url": result.get("url", "about:blank"),
+            "content": result.get("content", ""),
+            "score": result.get("score", 0.0)
+        })
+    return results
+
+# --- 3. THE TOOL ---
 @tool
-def search_web(query: str, max_results: int = 3) -> List[SearchResult]:
+async def search_web(query: str, max_results: int = 3) -> List[SearchResult]:
     """
     Searches the web for the given query and returns a list of verified results.
     Useful for finding current events, documentation, or facts not in the database.
@@ -40,8 +120,6 @@ def search_web(query: str, max_results: int = 3) -> List[SearchResult]:
             "score": 0.0
         }]
 
-    client = TavilyClient(api_key=api_key)
-    
     # Clean the query to remove accidental double-quotes which can break search
     clean_query = query.strip('"').strip("'")
     
@@ -51,31 +129,31 @@ def search_web(query: str, max_results: int = 3) -> List[SearchResult]:
         # We enforce a "site:" filter to keep results relevant to Neo4j
         # You can remove this f-string if you want broad internet search later
         targeted_query = f"site:neo4j.com/docs OR site:neo4j.com/labs {clean_query}"
+        key = (targeted_query, max_results)
 
-        response = client.search(
-            query=targeted_query, 
-            search_depth="advanced", 
-            max_results=max_results,
-            include_raw_content=False # We want the AI-summarized 'content', not HTML
-        )
-        
-        # --- 3. NORMALIZE THE OUTPUT ---
-        # Map the raw API response to our strict SearchResult schema
-        results: List[SearchResult] = []
-        
-        for result in response.get("results", []):
-            # Handle potential missing keys safely
-            results.append({
-                "title": result.get("title", "No Title"),
-                "url": result.get("url", "about:blank"),
-                "content": result.get("content", ""),
-                "score": result.get("score", 0.0)
-            })
+        results = _cache_get(key)
+        if results is None:
+            # Single-flight: concurrent misses on the same key share one request
+            lock = _locks.setdefault(key, asyncio.Lock())
+            _lock_users[key] = _lock_users.get(key, 0) + 1
+            try:
+                async with lock:
+                    results = _cache_get(key)
+                    if results is None:
+                        results = await _fetch_results(api_key, targeted_query, max_results)
+                        _cache_put(key, results)
+            finally:
+                # Drop the lock only once nobody holds or waits on it (even when the
+                # fetch failed), so a newer caller never gets a second lock for the key
+                _lock_users[key] -= 1
+                if not _lock_users[key]:
+                    del _lock_users[key]
+                    _locks.pop(key, None)
         
         # Log success summary
         logger.info(f"✅ Found {len(results)} results for '{clean_query}'")
         
-        return results
+        return list(results)
 
     except Exception as e:
         logger.error(f"❌ Search failed: {e}")
@@ -90,11 +168,19 @@ def search_web(query: str, max_results: int = 3) -> List[SearchResult]:
 # --- 4. ISOLATED TESTING ---
 if __name__ == "__main__":
     # Allows you to run 'python backend/tools/search.py' to verify behavior
+    import asyncio
     from dotenv import load_dotenv
     load_dotenv()
+    logging.basicConfig(level=logging.INFO)
     
     print("--- 🧪 Testing Search Tool ---")
-    test_results = search_web.invoke({"query": "Neo4j vector index configuration"})
+    async def run_test():
+        try:
+            return await search_web.ainvoke({"query": "Neo4j vector index configuration"})
+        finally:
+            await close_search_client()
+
+    test_results = asyncio.run(run_test())
     
     for r in test_results:
         print(r)